@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import io
+import calendar
 import datetime
 import plotly.express as px
 
@@ -69,90 +71,190 @@ html, body, [class*="st-"] {
 </style>
 """, unsafe_allow_html=True)
 
-def get_week_of_month(date):
-    return (date.day - 1) // 7 + 1
+# Indexed by month number (1-12); slot 0 is the empty string from calendar.month_name.
+MONTH_NAMES = np.array(list(calendar.month_name), dtype=object)
+
+REQUIRED_COLUMNS = ['Date', 'Amount', 'Category']
+
+EXCLUDED_CATEGORIES = ['Savings', 'Income']
+
+DATE_FORMATS = [
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
+    '%m/%d/%Y', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d', '%d %b %Y', '%b %d, %Y'
+]
+
+TIPS_MAPPING = {
+    'Groceries': "Try meal planning and buying in bulk to save on Groceries. Check for weekly flyers!",
+    'Restaurants': "Your spending on Restaurants is high. Consider cooking at home or bringing lunch to work 3-4 times a week.",
+    'Transport': "Look into carpooling or using public transportation more often to reduce your Transport costs.",
+    'Shopping': "Before making a purchase under Shopping, apply the 30-day rule: if you still want it after 30 days, buy it.",
+    'Entertainment': "Seek out free or low-cost Entertainment options like local parks, libraries, or free community events.",
+    'Utilities': "Reduce your Utilities bill by being mindful of energy use. Unplug devices and turn off lights when not in use.",
+    'Rent': "Rent is a fixed cost. Look for ways to reduce flexible spending to offset this major expense.",
+}
+GENERIC_TIP = "Always review your smallest, recurring expenses—they add up quickly! Try setting spending limits."
+
+def _sniff_date_format(samples):
+    # Pick the first common bank-statement format that fits every sampled value,
+    # so pandas can take its fixed-format fast path instead of inferring per row.
+    for fmt in DATE_FORMATS:
+        try:
+            for sample in samples:
+                datetime.datetime.strptime(sample, fmt)
+        except ValueError:
+            continue
+        return fmt
+    return None
+
+def _month_ranges(index):
+    # Map each (year, month) present in a sorted DatetimeIndex to its [start, stop) row range.
+    months = index.year.to_numpy(dtype=np.int64) * 12 + index.month.to_numpy(dtype=np.int64) - 1
+    boundaries = np.unique(months)
+    starts = np.searchsorted(months, boundaries, side='left')
+    stops = np.searchsorted(months, boundaries, side='right')
+    return {
+        (ordinal // 12, ordinal % 12 + 1): (start, stop)
+        for ordinal, start, stop in zip(boundaries.tolist(), starts.tolist(), stops.tolist())
+    }
+
+@st.cache_data(show_spinner=False)
+def _parse_bytes(raw):
+    # Peek at the header so usecols/dtype use the real (possibly padded) column names.
+    header = {col.strip(): col for col in pd.read_csv(io.BytesIO(raw), encoding='utf-8', nrows=0).columns}
+    read_options = dict(
+        usecols=[header[col] for col in REQUIRED_COLUMNS if col in header],
+        dtype={header.get('Category', 'Category'): 'category'}
+    )
+    df = None
+    try:
+        df = pd.read_csv(io.BytesIO(raw), engine='pyarrow', **read_options)
+    except ValueError:
+        # pyarrow rejects ragged rows and mixed-type columns; the C parser plus coercion below handles them.
+        pass
+    # pyarrow shifts offset timestamps to UTC, which can move a transaction into another month.
+    if df is None or isinstance(df[header.get('Date', 'Date')].dtype, pd.DatetimeTZDtype):
+        df = pd.read_csv(io.BytesIO(raw), encoding='utf-8', **read_options)
+    df.columns = [col.strip() for col in df.columns]
+    # pyarrow already types ISO date-times; everything else goes through to_datetime.
+    if not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        date_format = _sniff_date_format(df['Date'].dropna().astype(str).head(20))
+        df['Date'] = pd.to_datetime(df['Date'], format=date_format or 'mixed', cache=True, errors='coerce')
+    df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce')
+    df.dropna(subset=['Date', 'Amount'], inplace=True)
+    mask = (df['Amount'].to_numpy() > 0) & ~df['Category'].isin(EXCLUDED_CATEGORIES).to_numpy()
+    df_spent = df[mask]
+    # Sorted by Date, each year/month is a contiguous block that _filter_period can slice.
+    df_spent = df_spent.sort_values('Date', kind='mergesort').set_index('Date')
+    # Keeps sort=True: _period_category_sum slices this MultiIndex with .loc.
+    category_totals = df_spent.groupby(
+        [df_spent.index.year.rename('Year'), df_spent.index.month.rename('Month'), 'Category'],
+        observed=True
+    )['Amount'].sum()
+    return df_spent, _month_ranges(df_spent.index), category_totals
 
 def parse_data(uploaded_file):
     file_type = uploaded_file.name.split('.')[-1].lower()
-    df = None
     try:
         if file_type == 'csv':
-            data = io.StringIO(uploaded_file.getvalue().decode("utf-8"))
-            df = pd.read_csv(data)
+            parsed = _parse_bytes(uploaded_file.getvalue())
             st.success("CSV file loaded successfully.")
+            return parsed
         elif file_type == 'pdf':
             st.error("PDF files are unsupported for accurate financial data extraction. Please convert your bank statement to CSV format to proceed.")
-            return None
+            return None, None, None
         else:
             st.error(f"Unsupported file type: .{file_type}. Please upload a CSV or supported format.")
-            return None
-        df.columns = [col.strip() for col in df.columns]
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce')
-        df.dropna(subset=['Date', 'Amount'], inplace=True)
-        df['Year'] = df['Date'].dt.year
-        df['Month'] = df['Date'].dt.month
-        df['MonthName'] = df['Date'].dt.strftime('%B')
-        df['WeekOfMonth'] = df['Date'].apply(get_week_of_month)
-        df_spent = df[df['Amount'] > 0].copy()
-        df_spent = df_spent[~df_spent['Category'].isin(['Savings', 'Income'])].copy()
-        return df_spent
+            return None, None, None
     except Exception as e:
         st.error(f"Error processing file. Ensure it has 'Date', 'Amount', and 'Category' columns: {e}")
-        return None
+        return None, None, None
 
-def get_date_filters(df, yearly=False):
-    unique_years = sorted(df['Year'].unique(), reverse=True)
+def _filter_period(df, month_ranges, year, month):
+    if month is None:
+        ranges = [bounds for (y, _), bounds in month_ranges.items() if y == year]
+        start, stop = ranges[0][0], ranges[-1][1]
+    else:
+        start, stop = month_ranges[(year, month)]
+    return df.iloc[start:stop]
+
+def _period_category_sum(category_totals, year, month):
+    key = year if month is None else (year, month)
+    if key not in category_totals.index:
+        # Every transaction in the period was uncategorized.
+        return category_totals.iloc[:0].droplevel(['Year', 'Month'])
+    period_totals = category_totals.loc[key]
+    if month is None:
+        period_totals = period_totals.groupby(level='Category', sort=False, observed=True).sum()
+    return period_totals.sort_values(ascending=False)
+
+# The slice is in date order, so sort=False groups still come out chronologically.
+@st.cache_data(show_spinner=False)
+def _weekly_sum(df_filtered, yearly):
+    if yearly:
+        weekly_data = df_filtered.groupby(df_filtered.index.month, sort=False, observed=True)['Amount'].sum().reset_index()
+        weekly_data['Month'] = MONTH_NAMES[weekly_data['Date'].to_numpy()]
+    else:
+        week_of_month = ((df_filtered.index.day.to_numpy() - 1) // 7 + 1).astype(np.int8)
+        weekly_data = df_filtered.groupby(week_of_month, sort=False, observed=True)['Amount'].sum().rename_axis('WeekOfMonth').reset_index()
+        weekly_data['Week'] = 'Week ' + weekly_data['WeekOfMonth'].astype(str)
+    return weekly_data
+
+# Figure construction is keyed on the small aggregated frames, so reruns with the same
+# selection reuse the built figure instead of rebuilding it through Plotly Express.
+@st.cache_data(show_spinner=False)
+def _category_bar(pie_data):
+    fig_bar = px.bar(
+        pie_data,
+        x='Category', y='Amount', color='Category', 
+        title='Category Spending (Bar Chart)', color_discrete_sequence=px.colors.sequential.RdBu
+    )
+    fig_bar.update_layout(showlegend=False, xaxis_title="", yaxis_title="Amount ($)")
+    return fig_bar
+
+@st.cache_data(show_spinner=False)
+def _trend_line(weekly_data, x_col):
+    fig_line = px.line(
+        weekly_data, x=x_col, y='Amount', markers=True,
+        line_shape='linear', color_discrete_sequence=['#5cb85c'],
+        title='Spending Trend'
+    )
+    fig_line.update_layout(yaxis_title="Amount ($)", xaxis_title="")
+    return fig_line
+
+def get_date_filters(df, month_ranges, yearly=False):
+    unique_years = sorted({year for year, _ in month_ranges}, reverse=True)
     selected_year = st.sidebar.selectbox("Select Year:", unique_years, index=0)
     if yearly:
-        df_filtered = df[df['Year'] == selected_year]
+        selected_month = None
         selected_month_name = None
     else:
-        months_in_year = df[df['Year'] == selected_year]['MonthName'].unique()
-        latest_month_num = df[df['Year'] == selected_year]['Month'].max()
-        latest_month_name = df[df['Month'] == latest_month_num]['MonthName'].iloc[0]
-        try:
-            default_month_index = list(months_in_year).index(latest_month_name)
-        except:
-            default_month_index = 0
-        selected_month_name = st.sidebar.selectbox("Select Month:", months_in_year, index=default_month_index)
-        df_filtered = df[(df['Year'] == selected_year) & (df['MonthName'] == selected_month_name)]
-    return df_filtered, selected_year, selected_month_name
-
-def generate_contextual_tip(df_filtered):
-    if df_filtered.empty:
-        return "No spending data available to generate a specific tip."
-    category_spending = df_filtered.groupby('Category')['Amount'].sum().sort_values(ascending=False)
-    if category_spending.empty:
+        # The range map is built in date order, so months come out in calendar order and the latest is last.
+        months_in_year = [month for year, month in month_ranges if year == selected_year]
+        selected_month = st.sidebar.selectbox(
+            "Select Month:", months_in_year, index=len(months_in_year) - 1, format_func=MONTH_NAMES.__getitem__
+        )
+        selected_month_name = MONTH_NAMES[selected_month]
+    df_filtered = _filter_period(df, month_ranges, selected_year, selected_month)
+    return df_filtered, selected_year, selected_month, selected_month_name
+
+def generate_contextual_tip(category_sums):
+    if category_sums.empty:
         return "No categorized spending found. Start by categorizing your transactions!"
-    top_categories = category_spending.head(2).index.tolist()
-    tips_mapping = {
-        'Groceries': "Try meal planning and buying in bulk to save on Groceries. Check for weekly flyers!",
-        'Restaurants': "Your spending on Restaurants is high. Consider cooking at home or bringing lunch to work 3-4 times a week.",
-        'Transport': "Look into carpooling or using public transportation more often to reduce your Transport costs.",
-        'Shopping': "Before making a purchase under Shopping, apply the 30-day rule: if you still want it after 30 days, buy it.",
-        'Entertainment': "Seek out free or low-cost Entertainment options like local parks, libraries, or free community events.",
-        'Utilities': "Reduce your Utilities bill by being mindful of energy use. Unplug devices and turn off lights when not in use.",
-        'Rent': "Rent is a fixed cost. Look for ways to reduce flexible spending to offset this major expense.",
-    }
-    generic_tip = "Always review your smallest, recurring expenses—they add up quickly! Try setting spending limits."
-    tip = "Focus on reducing spending in your top categories: **" + " and ".join(top_categories) + "**. "
-    if top_categories:
-        top_cat = top_categories[0]
-        tip += tips_mapping.get(top_cat, generic_tip)
-    return tip
+    top_categories = category_sums.index[:2].tolist()
+    tip = f"Focus on reducing spending in your top categories: **{' and '.join(top_categories)}**. "
+    return tip + TIPS_MAPPING.get(top_categories[0], GENERIC_TIP)
 
 def predict_next_month_spending(df_filtered, salary):
     if df_filtered.empty:
         return 0, 0
     # Average monthly spending
-    monthly_spending = df_filtered.groupby(['Year','Month'])['Amount'].sum().reset_index()
-    predicted_spending = monthly_spending['Amount'].mean()
+    monthly_spending = df_filtered.groupby([df_filtered.index.year, df_filtered.index.month], sort=False, observed=True)['Amount'].sum()
+    predicted_spending = monthly_spending.mean()
     predicted_savings = salary - predicted_spending
     return predicted_spending, predicted_savings
 
-def category_forecast(df_filtered, predicted_spending):
-    cat_percent = df_filtered.groupby('Category')['Amount'].sum() / df_filtered['Amount'].sum()
+def category_forecast(category_sums, total_spent, predicted_spending):
+    cat_percent = category_sums / total_spent
     forecast = (cat_percent * predicted_spending).reset_index().rename(columns={'Amount':'Predicted_Amount'})
     return forecast
 
@@ -162,13 +264,16 @@ def show_upload_page():
     st.info("⚠️ For accurate financial analysis, please upload a **CSV file** containing columns for 'Date', 'Amount', and 'Category'. PDF files are not supported for table extraction.")
     uploaded_file = st.file_uploader("Choose a CSV file", type=['csv', 'pdf'], key="uploader")
     if uploaded_file is not None:
-        st.session_state['df_spent'] = parse_data(uploaded_file)
+        (st.session_state['df_spent'], st.session_state['month_ranges'],
+         st.session_state['category_totals']) = parse_data(uploaded_file)
         if st.session_state['df_spent'] is not None and not st.session_state['df_spent'].empty:
             st.success("File uploaded and parsed successfully! Navigate to the 'Manage' or 'Analyze' page.")
         elif st.session_state['df_spent'] is not None and st.session_state['df_spent'].empty:
             st.warning("File uploaded, but no relevant spending data (Amount > 0) was found after filtering.")
     else:
         st.session_state['df_spent'] = None
+        st.session_state['month_ranges'] = None
+        st.session_state['category_totals'] = None
 
 def show_manage_page():
     st.markdown("<div class='main-header'><h1>SpendWise</h1></div>", unsafe_allow_html=True)
@@ -178,7 +283,9 @@ def show_manage_page():
 
     view_option = st.sidebar.radio("View Type:", ["Monthly", "Yearly"], index=0)
     df_spent = st.session_state['df_spent']
-    df_filtered, selected_year, selected_month_name = get_date_filters(df_spent, yearly=(view_option=="Yearly"))
+    df_filtered, selected_year, selected_month, selected_month_name = get_date_filters(df_spent, st.session_state['month_ranges'], yearly=(view_option=="Yearly"))
+    # Computed once per render and shared by the tip, the top-category metrics and the forecast.
+    category_sums = _period_category_sum(st.session_state['category_totals'], selected_year, selected_month)
 
     salary = st.sidebar.number_input("Enter your monthly salary ($):", min_value=0.0, value=5000.0, step=100.0)
 
@@ -204,24 +311,25 @@ def show_manage_page():
 
     st.markdown("---")
     st.subheader("💡 Contextual Saving Tip")
-    st.info(generate_contextual_tip(df_filtered))
+    st.info(generate_contextual_tip(category_sums))
     st.markdown("---")
     st.subheader("Top Spending Categories")
 
-    top_categories_df = df_filtered.groupby('Category')['Amount'].sum().reset_index().sort_values(by='Amount', ascending=False)
-    if not top_categories_df.empty:
-        top_categories_df['Percentage'] = (top_categories_df['Amount'] / top_categories_df['Amount'].sum()) * 100
-        num_cols = min(3, len(top_categories_df))
+    if not category_sums.empty:
+        # category_sums is sorted descending, so the first entries are the top categories.
+        amounts = category_sums.to_numpy()
+        percentages = amounts / amounts.sum() * 100
+        num_cols = min(3, len(amounts))
         col_list = st.columns(num_cols)
-        for idx, row in enumerate(top_categories_df.head(num_cols).itertuples(index=False)):
+        for idx in range(num_cols):
             with col_list[idx]:
                 st.metric(
-                    label=row.Category,
-                    value=f"${row.Amount:,.2f}",
-                    delta=f"{row.Percentage:.1f}% of total"
+                    label=category_sums.index[idx],
+                    value=f"${amounts[idx]:,.2f}",
+                    delta=f"{percentages[idx]:.1f}% of total"
                 )
 
-    forecast_df = category_forecast(df_filtered, predicted_spending)
+    forecast_df = category_forecast(category_sums, total_spent, predicted_spending)
     st.subheader("Predicted Spending by Category")
     st.dataframe(forecast_df, use_container_width=True)
 
@@ -233,7 +341,7 @@ def show_analyze_page():
 
     view_option = st.sidebar.radio("View Type:", ["Monthly", "Yearly"], index=0)
     df_spent = st.session_state['df_spent']
-    df_filtered, selected_year, selected_month_name = get_date_filters(df_spent, yearly=(view_option=="Yearly"))
+    df_filtered, selected_year, selected_month, selected_month_name = get_date_filters(df_spent, st.session_state['month_ranges'], yearly=(view_option=="Yearly"))
 
     st.subheader(f"Detailed Analysis: {selected_year}" + (f" - {selected_month_name}" if selected_month_name else ""))
 
@@ -241,37 +349,20 @@ def show_analyze_page():
     if not df_filtered.empty:
         with col1:
             st.markdown("### Spending Breakdown by Category")
-            pie_data = df_filtered.groupby('Category')['Amount'].sum().reset_index()
-            fig_bar = px.bar(
-                pie_data.sort_values(by='Amount', ascending=True), # ascending order
-                x='Category', y='Amount', color='Category', 
-                title='Category Spending (Bar Chart)', color_discrete_sequence=px.colors.sequential.RdBu
-            )
-            fig_bar.update_layout(showlegend=False, xaxis_title="", yaxis_title="Amount ($)")
-            st.plotly_chart(fig_bar, use_container_width=True)
+            # Reverse the descending totals so the bars are in ascending order.
+            pie_data = _period_category_sum(st.session_state['category_totals'], selected_year, selected_month).iloc[::-1].reset_index()
+            st.plotly_chart(_category_bar(pie_data), use_container_width=True)
 
         with col2:
             st.markdown("### Weekly Spending Trend")
-            if view_option=="Monthly":
-                weekly_data = df_filtered.groupby('WeekOfMonth')['Amount'].sum().reset_index()
-                weekly_data['Week'] = 'Week ' + weekly_data['WeekOfMonth'].astype(str)
-                x_col = 'Week'
-            else:
-                weekly_data = df_filtered.groupby(df_filtered['Date'].dt.month)['Amount'].sum().reset_index()
-                weekly_data['Month'] = weekly_data['Date'].apply(lambda x: datetime.date(1900, x, 1).strftime('%B'))
-                x_col = 'Month'
-            fig_line = px.line(
-                weekly_data, x=x_col, y='Amount', markers=True,
-                line_shape='linear', color_discrete_sequence=['#5cb85c'],
-                title='Spending Trend'
-            )
-            fig_line.update_layout(yaxis_title="Amount ($)", xaxis_title="")
-            st.plotly_chart(fig_line, use_container_width=True)
+            weekly_data = _weekly_sum(df_filtered, yearly=(view_option=="Yearly"))
+            x_col = 'Month' if view_option=="Yearly" else 'Week'
+            st.plotly_chart(_trend_line(weekly_data, x_col), use_container_width=True)
 
     st.markdown("---")
     st.markdown("### Raw Transaction Data")
     if not df_filtered.empty:
-        st.dataframe(df_filtered[['Date', 'Category', 'Amount']].sort_values(by='Date'), use_container_width=True, hide_index=True)
+        st.dataframe(df_filtered.reset_index()[['Date', 'Category', 'Amount']], use_container_width=True, hide_index=True)
     else:
         st.info("No transactions found for the selected period.")
 
@@ -279,6 +370,10 @@ def main():
     st.sidebar.title("SpendWise Navigation")
     if 'df_spent' not in st.session_state:
         st.session_state['df_spent'] = None
+    if 'month_ranges' not in st.session_state:
+        st.session_state['month_ranges'] = None
+    if 'category_totals' not in st.session_state:
+        st.session_state['category_totals'] = None
     page = st.sidebar.radio("Go to:", ("Upload", "Manage", "Analyze"))
     if page == "Upload":
         show_upload_page()